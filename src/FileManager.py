@@ -1,7 +1,26 @@
 import os
 import time
+import json
 from datetime import datetime, date
 import cv2
+import numpy as np
+from lamb_filter import Yi, Xi, Hi, Wi
+
+# perfiles de almacenamiento por categoria:
+#   "full":       imagenes completas de color y profundidad
+#   "roi":        solo la zona de interes (Yi:Yi+Hi, Xi:Xi+Wi) de ambas imagenes
+#   "preview":    imagenes completas reducidas al preview_scale_percent
+#   "depth_only": solo la zona de interes de la imagen de profundidad
+STORAGE_PROFILES = {"lamb": "full", "no_lamb": "roi", "error": "roi"}
+__DEFAULT_PROFILE__ = "full"
+
+# porcentaje de reduccion de las imagenes en el perfil "preview"
+preview_scale_percent = 25
+
+# fichero (en savings/) donde se anota la geometria de cada imagen guardada
+__MANIFEST__ = "manifest.jsonl"
+# ficheros exportados y borrados por export_savings.py --prune-no-lamb (uno por linea)
+__PRUNED__ = "manifest_pruned.txt"
 
 
 class FileManager(Exception):
@@ -21,7 +40,8 @@ def get_saved_info():
 	def make_info(path):
 		items = get_items_in_dir(path)
 		info = {"n_color": len(items), "size_color": get_size(items), "n_depth": None, "size_depth": None}
-		items = list(map(lambda x: x.replace("color", "depth"), items))
+		# depth_only saves have no color image, so the depth folder is walked on its own
+		items = get_items_in_dir(path.replace("color", "depth"))
 		info["n_depth"] = len(items)
 		info["size_depth"] = get_size(items)
 		return info
@@ -47,6 +67,10 @@ def save_frames(color_frame, depth_frame, id_crotal=None, cam="cam01"):
 	:param depth_frame: numpy array with (640x480x1) of shape, the depth image.
 	:param id_crotal: string with the info of the lamb which is in the image.
 	:param cam: string with the info of the camera where the frames have been taken.
+	The images are stored following the profile of STORAGE_PROFILES for the category (id_crotal)
+	and the geometry of the stored images is appended to the manifest (savings/manifest.jsonl).
+	:return: dict with the manifest record of the saved frames (None if nothing has been saved).
+	:raise FileManager: if a file or the manifest could not be written (e.g. the disk is full).
 	"""
 	ts = time.time()
 	if id_crotal is not None:
@@ -67,21 +91,106 @@ def save_frames(color_frame, depth_frame, id_crotal=None, cam="cam01"):
 			path_color = mkdirs(mypath, ("savings", "color", id_crotal, date.today()))
 			path_depth = mkdirs(mypath, ("savings", "depth", id_crotal, date.today()))
 
-		filename = os.path.join(path_color, "{}_{}_{}.png".format(datetime.fromtimestamp(ts), cam, "color"))
+		profile = STORAGE_PROFILES.get(id_crotal, __DEFAULT_PROFILE__)
+		color_frame, geometry = __apply_profile__(color_frame, profile, cv2.INTER_AREA)
+		depth_frame, _ = __apply_profile__(depth_frame, profile, cv2.INTER_NEAREST)
 
-		correct, filename = __is_new_file_correct__(filename)
-		if correct:
-			cv2.imwrite(filename=filename, img=color_frame)
-		else:
-			raise FileManager("filename incorrect!!")
+		filename = os.path.join(path_color, "{}_{}_{}.png".format(datetime.fromtimestamp(ts), cam, "color"))
+		saved = {"color": None, "depth": None}
+
+		if profile != "depth_only":
+			correct, filename = __is_new_file_correct__(filename)
+			if correct:
+				if not cv2.imwrite(filename=filename, img=color_frame):
+					raise FileManager("It couldn't write the file " + filename)
+				saved["color"] = filename
+			else:
+				raise FileManager("filename incorrect!!")
 		# They both have a similar path, so this is more efficient; otherwise we should use the path_depth
 		filename = filename.replace("color", "depth")
 		correct, filename = __is_new_file_correct__(filename)
 		if correct:
-			cv2.imwrite(filename=filename, img=depth_frame)
+			if not cv2.imwrite(filename=filename, img=depth_frame):
+				raise FileManager("It couldn't write the file " + filename)
+			saved["depth"] = filename
 		else:
 			raise FileManager("filename incorrect!!")
 
+		savings = os.path.join(mypath, "savings")
+		record = {"timestamp": ts, "cam": cam, "category": id_crotal, "profile": profile}
+		for key, path in saved.items():
+			record[key] = None if path is None else os.path.relpath(path, savings)
+		record.update(geometry)
+		__append_manifest__(savings, record)
+		return record
+
+
+def place_in_frame(image, record):
+	"""
+	It places a stored image back into the frame coordinates using its manifest record.
+	:param image: numpy array with the stored image (full, roi or preview).
+	:param record: dict with the manifest entry of the image.
+	:return: numpy array with the shape of the original frame; the pixels out of the stored
+		area are set to 0.
+	"""
+	if record["scale"] != 1.0:
+		image = cv2.resize(image, (record["width"], record["height"]), interpolation=cv2.INTER_NEAREST)
+	frame = np.zeros((record["frame_height"], record["frame_width"]) + image.shape[2:], dtype=image.dtype)
+	frame[record["y"]:record["y"] + record["height"], record["x"]:record["x"] + record["width"]] = image
+	return frame
+
+
+def read_manifest(path=None):
+	"""
+	It reads the manifest of the stored images.
+	:param path: string with the savings folder (~/LambSM/savings by default).
+	:return: list of dicts, one for each saved pair of frames which has not been pruned.
+	"""
+	if path is None:
+		path = os.path.join(os.path.expanduser("~"), "LambSM", "savings")
+	filename = os.path.join(path, __MANIFEST__)
+	if not os.path.exists(filename):
+		return []
+	pruned = set()
+	if os.path.exists(os.path.join(path, __PRUNED__)):
+		with open(os.path.join(path, __PRUNED__), "r") as f:
+			pruned = set(line.strip() for line in f if line.strip())
+	with open(filename, "r") as f:
+		records = [json.loads(line) for line in f if line.strip()]
+	return [record for record in records
+			if not all(record.get(key) in pruned for key in ("color", "depth") if record.get(key))]
+
+
+def __apply_profile__(image, profile, interpolation):
+	"""
+	It reduces the image following the storage profile.
+	:return: tuple(numpy array, dict) the image to store and its geometry in the original frame.
+	"""
+	frame_height, frame_width = image.shape[:2]
+	geometry = {"frame_width": frame_width, "frame_height": frame_height,
+				"x": 0, "y": 0, "width": frame_width, "height": frame_height, "scale": 1.0}
+	if profile in ("roi", "depth_only"):
+		image = np.ascontiguousarray(image[Yi:Yi + Hi, Xi:Xi + Wi])
+		geometry.update({"x": Xi, "y": Yi, "width": image.shape[1], "height": image.shape[0]})
+	elif profile == "preview":
+		dim = (int(frame_width * preview_scale_percent / 100), int(frame_height * preview_scale_percent / 100))
+		image = cv2.resize(image, dim, interpolation=interpolation)
+		geometry["scale"] = preview_scale_percent / 100
+	elif profile != "full":
+		raise FileManager("Unknown storage profile: " + str(profile))
+	return image, geometry
+
+
+def __append_manifest__(path, record):
+	correct, filename = __is_new_file_correct__(os.path.join(path, __MANIFEST__))
+	if not correct:
+		raise FileManager("manifest filename incorrect!!")
+	try:
+		with open(filename, "a") as f:
+			f.write(json.dumps(record, default=str) + "\n")
+	except OSError as e:
+		raise FileManager("It couldn't write the manifest " + filename + ": " + str(e))
+
 
 def __is_new_file_correct__(file):
 	dircorrect, dirname = __is_dir_file_correct__(file)
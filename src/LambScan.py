@@ -113,6 +113,39 @@ if __name__ == '__main__':
 	parameters = {}
 	for i in ic.getProperties():
 		parameters[str(i)] = str(ic.getProperties().getProperty(i))
+
+	# Topic Manager
+	# The scanner keeps working without IceStorm, it just does not publish its events
+	proxy = ic.getProperties().getProperty("TopicManager.Proxy")
+	obj = ic.stringToProxy(proxy)
+	try:
+		topicManager = IceStorm.TopicManagerPrx.checkedCast(obj)
+	except Ice.Exception as e:
+		print('Cannot connect to IceStorm! (' + proxy + '). LambScanEvents will not be published')
+		topicManager = None
+
+	# Create a proxy to publish a LambScanEvents topic
+	if topicManager:
+		try:
+			topic = False
+			try:
+				topic = topicManager.retrieve("LambScanEvents")
+			except:
+				pass
+			while not topic:
+				try:
+					topic = topicManager.retrieve("LambScanEvents")
+				except IceStorm.NoSuchTopic:
+					try:
+						topic = topicManager.create("LambScanEvents")
+					except:
+						print('Another client created the LambScanEvents topic? ...')
+			pub = topic.getPublisher().ice_oneway()
+			lambscaneventsTopic = RoboCompLambScanEvents.LambScanEventsPrx.uncheckedCast(pub)
+			mprx["LambScanEventsPub"] = lambscaneventsTopic
+		except Ice.Exception as e:
+			# IceStorm has gone away after the checkedCast
+			print('Cannot get the LambScanEvents topic from IceStorm! (' + proxy + '). LambScanEvents will not be published\n', e)
 	if status == 0:
 		worker = SpecificWorker(mprx)
 		worker.setParams(parameters)
@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Depth conditioning of the region of interest before the lamb detection: invalid pixels masking,
+short hole filling and temporal smoothing, vectorized with NumPy over buffers which are reused between frames.
+The holes are filled in time only (for max_fill_age frames). The spatial hole filling is done by the
+voxel map of lamb_filter: each voxel is the mean of its valid pixels (weighted with self.weights), so
+a hole takes the depth of the valid pixels around it, and a voxel with too few of them is left out.
+Running it as a script benchmarks it against the full frame filters of the SDK:
+
+	python3 depth_conditioning.py [frames]
+"""
+import sys
+import time
+import numpy as np
+
+# profundidad maxima valida (mm); los pixeles a 0 o por encima no son validos
+max_depth = 10000
+# suavizado temporal: peso del frame actual y salto (mm) a partir del cual no se suaviza el pixel
+temporal_alpha = 0.4
+temporal_delta = 50
+# frames que un pixel no valido mantiene su ultimo valor suavizado (huecos breves y speckle)
+max_fill_age = 3
+
+
+class DepthConditioner:
+	"""
+	It conditions the depth crop of the region of interest:
+	- the valid pixels are smoothed with an exponential average, except where the depth jumps more than
+	  temporal_delta (something moved), which are taken as they are;
+	- the invalid pixels (0 or farther than max_depth) keep the last smoothed value of the pixel for
+	  max_fill_age frames at most. After that they are masked out: their depth is 0 and their weight
+	  (self.weights) is 0, so the voxel map can leave them out of the count instead of guessing them.
+	self.valid_fraction is the fraction of valid pixels of the last frame (without the filled ones),
+	which tells when the camera is covered or blinded.
+	The result is a float32 buffer owned by the conditioner, overwritten by the next call.
+	"""
+
+	def __init__(self):
+		self.__shape__ = None
+		self.valid_fraction = 1.0
+		self.weights = None
+
+	def reset(self, shape=None):
+		self.__shape__ = shape
+		self.valid_fraction = 1.0
+		if shape is None:
+			self.weights = None
+			return
+		self.__smooth__ = np.zeros(shape, dtype=np.float32)
+		self.__history__ = np.zeros(shape, dtype=bool)
+		self.__age__ = np.full(shape, max_fill_age + 1, dtype=np.int32)
+		self.__current__ = np.empty(shape, dtype=np.float32)
+		self.__diff__ = np.empty(shape, dtype=np.float32)
+		self.__valid__ = np.empty(shape, dtype=bool)
+		self.__mask__ = np.empty(shape, dtype=bool)
+		self.__usable__ = np.empty(shape, dtype=bool)
+		self.weights = np.empty(shape, dtype=np.float32)
+
+	def process(self, depth):
+		"""
+		:param depth: numpy array (h, w) with the z16 depth of the region of interest.
+		:return: numpy array (h, w) float32 with the conditioned depth (0 where self.weights is 0).
+		"""
+		if depth.shape != self.__shape__:
+			self.reset(depth.shape)
+		current, valid, mask, usable = self.__current__, self.__valid__, self.__mask__, self.__usable__
+		smooth, diff, age = self.__smooth__, self.__diff__, self.__age__
+		current[...] = depth
+		np.greater(current, 0, out=valid)
+		np.less_equal(current, max_depth, out=mask)
+		np.logical_and(valid, mask, out=valid)
+		self.valid_fraction = np.count_nonzero(valid) / valid.size
+
+		# frames desde que cada pixel fue valido por ultima vez
+		np.copyto(age, 0, where=valid)
+		np.logical_not(valid, out=mask)
+		np.add(age, 1, out=age, where=mask)
+		np.minimum(age, max_fill_age + 1, out=age)
+
+		# suavizado temporal de los pixeles validos que no han dado un salto
+		np.subtract(current, smooth, out=diff)
+		np.abs(diff, out=diff)
+		np.less_equal(diff, temporal_delta, out=mask)
+		np.logical_and(mask, self.__history__, out=mask)
+		np.logical_and(mask, valid, out=mask)
+		np.subtract(current, smooth, out=diff)
+		np.multiply(diff, temporal_alpha, out=diff)
+		np.add(smooth, diff, out=smooth, where=mask)
+		np.logical_not(mask, out=mask)
+		np.logical_and(mask, valid, out=mask)
+		np.copyto(smooth, current, where=mask)
+		np.logical_or(self.__history__, valid, out=self.__history__)
+
+		# pixeles utilizables: los validos y los no validos con un valor reciente
+		np.less_equal(age, max_fill_age, out=usable)
+		np.logical_and(usable, self.__history__, out=usable)
+		np.multiply(smooth, usable, out=current)
+		np.copyto(self.weights, usable)
+		return current
+
+
+def benchmark(frames=300, roi=(146, 52, 161, 538)):
+	"""
+	It measures the per frame cost of the conditioning of the region of interest and, if a camera is
+	connected, of the spatial, temporal and hole filling filters of the SDK on the whole 640x480 frame.
+	:param frames: int with the number of frames to measure.
+	:param roi: tuple (y, x, h, w) with the region of interest.
+	:return: dict with the ms per frame of each one.
+	"""
+	y, x, h, w = roi
+	result = {}
+	rng = np.random.default_rng(0)
+	synthetic = rng.integers(1000, 1500, size=(8, 480, 640)).astype(np.uint16)
+	synthetic[rng.random(synthetic.shape) < 0.05] = 0
+	conditioner = DepthConditioner()
+	ts = time.perf_counter()
+	for i in range(frames):
+		conditioner.process(synthetic[i % len(synthetic)][y:y + h, x:x + w])
+	result["roi_numpy_ms"] = round(1000 * (time.perf_counter() - ts) / frames, 3)
+
+	try:
+		import pyrealsense2 as rs
+		pipeline = rs.pipeline()
+		config = rs.config()
+		config.enable_stream(rs.stream.depth, 640, 480, rs.format.z16, 30)
+		pipeline.start(config)
+	except Exception as e:
+		print("SDK filters not measured (no camera or no pyrealsense2):", e)
+		return result
+	try:
+		filters = (rs.spatial_filter(), rs.temporal_filter(), rs.hole_filling_filter())
+		sdk, roi_live = 0.0, 0.0
+		conditioner = DepthConditioner()
+		for i in range(frames):
+			depth_frame = pipeline.wait_for_frames().get_depth_frame()
+			ts = time.perf_counter()
+			filtered = depth_frame
+			for f in filters:
+				filtered = f.process(filtered)
+			np.asanyarray(filtered.get_data())
+			sdk += time.perf_counter() - ts
+			ts = time.perf_counter()
+			conditioner.process(np.asanyarray(depth_frame.get_data())[y:y + h, x:x + w])
+			roi_live += time.perf_counter() - ts
+		result["full_frame_sdk_ms"] = round(1000 * sdk / frames, 3)
+		result["roi_numpy_live_ms"] = round(1000 * roi_live / frames, 3)
+	finally:
+		pipeline.stop()
+	return result
+
+
+if __name__ == '__main__':
+	print(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 300))
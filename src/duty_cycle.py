@@ -0,0 +1,128 @@
+import time
+from datetime import datetime
+
+
+def parse_windows(text):
+	"""
+	:param text: string with the active windows, e.g. "06:00-14:00,16:30-20:00" (a window may go past
+		midnight, e.g. "22:00-02:00"). An empty string means always active.
+	:return: list of tuples (start, end) with the minutes of the day.
+	"""
+	windows = []
+	for window in filter(None, (w.strip() for w in text.split(","))):
+		try:
+			start, end = window.split("-")
+			times = [tuple(int(v) for v in t.strip().split(":")) for t in (start, end)]
+			if any(len(t) != 2 or not (0 <= t[0] < 24 and 0 <= t[1] < 60) for t in times):
+				raise ValueError
+		except ValueError:
+			raise ValueError("Wrong active window (HH:MM-HH:MM): " + window)
+		start, end = [h * 60 + m for h, m in times]
+		if start == end:
+			raise ValueError("Empty active window (same start and end): " + window)
+		windows.append((start, end))
+	return windows
+
+
+class DutyCycle:
+	"""
+	It decides when the scanner has to be capturing: inside the active windows, or for activity_hold
+	seconds after a wake-up probe or the detection has seen something in the race. Outside of them the worker stops the
+	camera and waits in the idle state, probing the race every probe_period seconds.
+	It also keeps the time spent active and idle and how long it takes to resume the capture.
+	"""
+
+	def __init__(self, windows="", probe_period=600, activity_hold=900):
+		"""
+		:param windows: string with the active windows (see parse_windows).
+		:param probe_period: seconds between two wake-up probes while idle.
+		:param activity_hold: seconds of capture after a probe has seen activity.
+		"""
+		self.windows = parse_windows(windows)
+		self.probe_period = probe_period
+		self.activity_hold = activity_hold
+		self.__hold_until__ = 0.0
+		self.__last_probe__ = 0.0
+		self.__idle__ = False
+		self.__since__ = time.time()
+		self.__resume_start__ = None
+		self.stats = {"active_seconds": 0.0, "idle_seconds": 0.0, "probes": 0, "woken_by_probe": 0,
+					  "resumes": 0, "resume_seconds": 0.0}
+
+	def is_active(self, now=None):
+		"""
+		:param now: float with the timestamp to check (now by default).
+		:return: bool, True if the scanner has to be capturing.
+		"""
+		now = time.time() if now is None else now
+		if not self.windows or now < self.__hold_until__:
+			return True
+		current = datetime.fromtimestamp(now)
+		minute = current.hour * 60 + current.minute
+		for start, end in self.windows:
+			if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+				return True
+		return False
+
+	def probe_due(self, now=None):
+		now = time.time() if now is None else now
+		return now - self.__last_probe__ >= self.probe_period
+
+	def probed(self, activity, now=None):
+		"""
+		It records a wake-up probe.
+		:param activity: bool, True if the probe has seen something in the race.
+		"""
+		now = time.time() if now is None else now
+		self.__last_probe__ = now
+		self.stats["probes"] += 1
+		if activity:
+			self.stats["woken_by_probe"] += 1
+			self.__hold_until__ = now + self.activity_hold
+
+	def activity(self, now=None):
+		"""
+		It records activity seen by the detection while capturing: the capture goes on for activity_hold
+		seconds more, so a wake-up does not stop the camera in the middle of a group of lambs.
+		"""
+		now = time.time() if now is None else now
+		self.__hold_until__ = max(self.__hold_until__, now + self.activity_hold)
+
+	def enter_idle(self):
+		if not self.__idle__:
+			self.__account__()
+			self.__idle__ = True
+			# the first probe waits a whole period
+			self.__last_probe__ = time.time()
+
+	def leave_idle(self):
+		if self.__idle__:
+			self.__account__()
+			self.__idle__ = False
+			self.__resume_start__ = time.time()
+
+	def resumed(self):
+		"""
+		It records that the capture is running again after leaving the idle state.
+		"""
+		if self.__resume_start__ is not None:
+			self.stats["resumes"] += 1
+			self.stats["resume_seconds"] += time.time() - self.__resume_start__
+			self.__resume_start__ = None
+
+	def get_stats(self):
+		"""
+		:return: dict with the hours active and idle, the probes and the mean seconds to resume the capture.
+		"""
+		self.__account__()
+		return {"active_hours": round(self.stats["active_seconds"] / 3600, 2),
+				"idle_hours": round(self.stats["idle_seconds"] / 3600, 2),
+				"probes": self.stats["probes"], "woken_by_probe": self.stats["woken_by_probe"],
+				"resumes": self.stats["resumes"],
+				"mean_resume_seconds": round(self.stats["resume_seconds"] / self.stats["resumes"], 2)
+				if self.stats["resumes"] else 0.0}
+
+	def __account__(self):
+		now = time.time()
+		self.stats["idle_seconds" if self.__idle__ else "active_seconds"] += now - self.__since__
+		self.__since__ = now
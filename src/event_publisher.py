@@ -0,0 +1,86 @@
+import os
+import time
+import shutil
+import Ice
+import RoboCompLambScanEvents
+
+
+class EventPublisher:
+	"""
+	It batches the detection events of the worker and publishes them, together with the health
+	of the device, to the LambScanEvents topic of IceStorm once per period, so the aggregator
+	receives a single message per device and period instead of one per frame.
+	Consecutive detections with the same verdict which have not been saved are coalesced into
+	a single event (count, first/last timestamp and min/max voxels).
+	"""
+
+	def __init__(self, proxy, device, period=60, max_events=500):
+		"""
+		:param proxy: LambScanEventsPrx of the topic publisher, or None to disable the publishing.
+		:param device: string with the name of the device in the fleet.
+		:param period: seconds between two published batches.
+		:param max_events: max number of events kept; the oldest ones are dropped first.
+		"""
+		self.proxy = proxy
+		self.device = device
+		self.period = period
+		self.max_events = max_events
+		self.__events__ = []
+		self.__last_publish__ = time.time()
+
+	def add_detection(self, voxels, verdict, saved, path="", cam="cam01", ts=None):
+		"""
+		:param voxels: int with the number of voxels returned by the lamb filter.
+		:param verdict: string with the category of the frame.
+		:param saved: bool, True if the frame has been saved.
+		:param path: string with the saved file (empty if it has not been saved).
+		:param cam: string with the camera where the frame has been taken.
+		:param ts: float with the timestamp of the frame (now by default).
+		"""
+		if self.proxy is None:
+			return
+		ts = time.time() if ts is None else ts
+		voxels = int(voxels)
+		last = self.__events__[-1] if self.__events__ else None
+		if last is not None and not saved and not last.saved and last.verdict == verdict and last.cam == cam:
+			last.lastTimestamp = ts
+			last.count += 1
+			last.minVoxels = min(last.minVoxels, voxels)
+			last.maxVoxels = max(last.maxVoxels, voxels)
+		else:
+			self.__events__.append(RoboCompLambScanEvents.DetectionEvent(
+				cam=cam, verdict=verdict, saved=saved, path=path or "", firstTimestamp=ts, lastTimestamp=ts,
+				count=1, minVoxels=voxels, maxVoxels=voxels))
+			del self.__events__[:-self.max_events]
+
+	def publish_if_due(self, camera_ok, no_camera=0, no_memory=0, idle=False):
+		"""
+		It publishes the pending events if the period has elapsed.
+		"""
+		if time.time() - self.__last_publish__ >= self.period:
+			self.publish(camera_ok, no_camera, no_memory, idle)
+
+	def publish(self, camera_ok, no_camera=0, no_memory=0, idle=False):
+		"""
+		It publishes the pending events and the health of the device right now.
+		:param camera_ok: bool, True if the camera is working (streaming, or answering the probes while idle).
+		:param no_camera: int with the failed reconnection attempts of the camera.
+		:param no_memory: int with the failed writing attempts.
+		:param idle: bool, True if the camera is stopped by the duty cycle.
+		"""
+		self.__last_publish__ = time.time()
+		if self.proxy is None:
+			return
+		try:
+			disk = shutil.disk_usage(os.path.join(os.path.expanduser("~"), "LambSM"))
+		except OSError:
+			disk = shutil.disk_usage(os.path.expanduser("~"))
+		health = RoboCompLambScanEvents.HealthEvent(
+			timestamp=self.__last_publish__, cameraOk=camera_ok, idle=idle, noCamera=no_camera, noMemory=no_memory,
+			diskFree=disk.free, diskTotal=disk.total)
+		try:
+			self.proxy.pushEvents(self.device, self.__events__, health)
+			self.__events__ = []
+		except Ice.Exception as e:
+			# the events are kept for the next period
+			print("Problem publishing the LambScanEvents\n", e)
@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+It packs the saved frames (savings/{color,depth}/{category}/{date}/) into big tar shards,
+one group of shards for each date, category and camera, so they can be moved out of the
+device with sequential I/O instead of millions of small-file operations.
+The exported files are written down in a manifest inside the output folder, so the
+export is incremental and it can be resumed after an interruption.
+Each shard carries the records of savings/manifest.jsonl of its files (as manifest.jsonl inside the
+tar and in the export manifest), so the ROI crops can be placed back into frame coordinates.
+The scanner keeps appending to savings/manifest.jsonl while the export runs, so the pruned files
+are not removed from it: they are listed in savings/manifest_pruned.txt instead.
+
+Usage: python3 export_savings.py <output folder> [--prune-no-lamb] [--include-today]
+"""
+import os
+import sys
+import json
+import time
+import io
+import tarfile
+import argparse
+from datetime import date
+
+__SAVINGS__ = os.path.join(os.path.expanduser("~"), "LambSM", "savings")
+__MANIFEST__ = "export_manifest.jsonl"
+# manifest of the saved frames (FileManager.save_frames) and list of the pruned files
+__SAVINGS_MANIFEST__ = "manifest.jsonl"
+__PRUNED__ = "manifest_pruned.txt"
+__KINDS__ = ("color", "depth")
+
+# tamaño maximo de cada shard
+shard_size = 1024 * 1024 * 1024  # 1 GB
+
+
+def get_pending_files(savings, exported, include_today=False):
+	"""
+	It walks the savings tree looking for the files which have not been exported yet.
+	:param savings: string with the savings folder.
+	:param exported: set with the relative paths of the exported files.
+	:param include_today: bool, if False the folders of today (still being written) are skipped.
+	:return: dict {(date, category, cam): [relative paths]}
+	"""
+	today = str(date.today())
+	groups = {}
+	for kind in __KINDS__:
+		for (dirpath, dirnames, filenames) in os.walk(os.path.join(savings, kind)):
+			dirnames.sort()
+			parts = os.path.relpath(dirpath, savings).split(os.sep)
+			# kind / category / date
+			if len(parts) != 3 or (parts[2] == today and not include_today):
+				continue
+			for file in sorted(filenames):
+				relpath = os.path.join(dirpath, file)
+				relpath = os.path.relpath(relpath, savings)
+				if relpath in exported:
+					continue
+				# "<datetime>_<cam>_<kind>.png"
+				name = os.path.splitext(file)[0].rsplit("_", 2)
+				cam = name[1] if len(name) == 3 else "unknown"
+				groups.setdefault((parts[2], parts[1], cam), []).append(relpath)
+	return groups
+
+
+def read_export_manifest(output):
+	"""
+	:param output: string with the export folder.
+	:return: list of dicts, one for each exported shard.
+	"""
+	filename = os.path.join(output, __MANIFEST__)
+	if not os.path.exists(filename):
+		return []
+	with open(filename, "r") as f:
+		return [json.loads(line) for line in f if line.strip()]
+
+
+def export(output, savings=__SAVINGS__, prune_no_lamb=False, include_today=False):
+	"""
+	It exports the pending files of the savings tree to tar shards in the output folder.
+	:param output: string with the export folder (e.g. a USB disk).
+	:param savings: string with the savings folder.
+	:param prune_no_lamb: bool, if True the exported no_lamb files are removed from the savings tree.
+	:param include_today: bool, if True the folders of today are also exported.
+	:return: dict with the stats of the export (files, shards, bytes, seconds, MB/s, files/s).
+	"""
+	os.makedirs(output, exist_ok=True)
+	shards = read_export_manifest(output)
+	exported = set(file for shard in shards for file in shard["files"])
+	# the shards of an interrupted run were never written down in the manifest
+	for (dirpath, dirnames, filenames) in os.walk(output):
+		for file in filenames:
+			if file.endswith(".tar.part"):
+				os.remove(os.path.join(dirpath, file))
+
+	records_by_file = {}
+	for record in __read_savings_manifest__(savings):
+		for key in ("color", "depth"):
+			if record.get(key):
+				records_by_file.setdefault(record[key], []).append(record)
+
+	stats = {"files": 0, "shards": 0, "bytes": 0, "seconds": 0.0, "MB/s": 0.0, "files/s": 0.0}
+	start = time.time()
+	groups = get_pending_files(savings, exported, include_today)
+	for (day, category, cam), files in sorted(groups.items()):
+		index = sum(1 for shard in shards if (shard["date"], shard["category"], shard["cam"]) == (day, category, cam))
+		sizes = [os.path.getsize(os.path.join(savings, file)) for file in files]
+		first = 0
+		while first < len(files):
+			last, size = first, 0
+			while last < len(files) and (last == first or size + sizes[last] <= shard_size):
+				size += sizes[last]
+				last += 1
+			batch = files[first:last]
+			first = last
+			name = os.path.join(day, category, "{}_{}_{}_{:04d}.tar".format(day, category, cam, index))
+			records, seen = [], set()
+			for file in batch:
+				for record in records_by_file.get(file, []):
+					if id(record) not in seen:
+						seen.add(id(record))
+						records.append(record)
+			__write_shard__(savings, output, name, batch, records)
+			shard = {"shard": name, "date": day, "category": category, "cam": cam, "files": batch, "bytes": size,
+					 "records": records}
+			with open(os.path.join(output, __MANIFEST__), "a") as f:
+				f.write(json.dumps(shard) + "\n")
+			shards.append(shard)
+			index += 1
+			stats["files"] += len(batch)
+			stats["shards"] += 1
+			stats["bytes"] += size
+			if prune_no_lamb and category == "no_lamb":
+				# the geometry of the pruned files is kept in their shards
+				with open(os.path.join(savings, __PRUNED__), "a") as f:
+					f.write("".join(file + "\n" for file in batch))
+				__prune__(savings, batch)
+
+	stats["seconds"] = round(time.time() - start, 3)
+	if stats["seconds"] > 0:
+		stats["MB/s"] = round(stats["bytes"] / (1024 * 1024) / stats["seconds"], 2)
+		stats["files/s"] = round(stats["files"] / stats["seconds"], 2)
+	return stats
+
+
+def __write_shard__(savings, output, name, files, records):
+	"""
+	It writes the shard to a temporary ".part" file and renames it once it is complete,
+	so a shard in the output folder is always a whole one.
+	The manifest records of the files are added as manifest.jsonl.
+	"""
+	filename = os.path.join(output, name)
+	os.makedirs(os.path.dirname(filename), exist_ok=True)
+	with tarfile.open(filename + ".part", "w") as tar:
+		for file in files:
+			tar.add(os.path.join(savings, file), arcname=file)
+		data = "".join(json.dumps(record) + "\n" for record in records).encode()
+		info = tarfile.TarInfo(__SAVINGS_MANIFEST__)
+		info.size = len(data)
+		info.mtime = time.time()
+		tar.addfile(info, io.BytesIO(data))
+	os.replace(filename + ".part", filename)
+
+
+def __prune__(savings, files):
+	for file in files:
+		path = os.path.join(savings, file)
+		if os.path.exists(path):
+			os.remove(path)
+		dirname = os.path.dirname(path)
+		if os.path.isdir(dirname) and not os.listdir(dirname):
+			os.rmdir(dirname)
+
+
+def __read_savings_manifest__(savings):
+	"""
+	:return: list of dicts with the records of the saved frames.
+	"""
+	filename = os.path.join(savings, __SAVINGS_MANIFEST__)
+	if not os.path.exists(filename):
+		return []
+	with open(filename, "rb") as f:
+		data = f.read()
+	# a line still being written by the scanner is left for the next run
+	data = data[:data.rfind(b"\n") + 1]
+	return [json.loads(line) for line in data.decode().splitlines() if line.strip()]
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Export the saved frames to tar shards")
+	parser.add_argument("output", help="folder where the shards and the export manifest are written")
+	parser.add_argument("--savings", default=__SAVINGS__, help="savings folder (default: %(default)s)")
+	parser.add_argument("--prune-no-lamb", action="store_true", help="remove the exported no_lamb files")
+	parser.add_argument("--include-today", action="store_true", help="also export the folders of today")
+	parser.add_argument("--shard-size", type=int, default=shard_size // (1024 * 1024), help="shard size in MB")
+	args = parser.parse_args()
+
+	shard_size = args.shard_size * 1024 * 1024
+	result = export(args.output, args.savings, args.prune_no_lamb, args.include_today)
+	print(json.dumps(result, indent=4))
+	sys.exit(0)
@@ -43,6 +43,21 @@ try:
 except:
 	print('SLICE_PATH environment variable was not exported. Using only the default paths')
 	pass
+icePaths.append(os.path.dirname(os.path.abspath(__file__)))
+
+ice_LambScanEvents = False
+for p in icePaths:
+	if os.path.isfile(p + '/LambScanEvents.ice'):
+		preStr = "-I/opt/robocomp/interfaces/ -I" + ROBOCOMP + "/interfaces/ " + additionalPathStr + " --all " + p + '/'
+		wholeStr = preStr + "LambScanEvents.ice"
+		Ice.loadSlice(wholeStr)
+		ice_LambScanEvents = True
+		break
+if not ice_LambScanEvents:
+	print('Couldn\'t load LambScanEvents')
+	sys.exit(-1)
+import RoboCompLambScanEvents
+from RoboCompLambScanEvents import *
 
 
 class GenericWorker(QtCore.QObject):
@@ -57,6 +72,7 @@ class GenericWorker(QtCore.QObject):
 	t_get_frames_to_no_camera = QtCore.Signal()
 	t_get_frames_to_get_frames = QtCore.Signal()
 	t_get_frames_to_exit = QtCore.Signal()
+	t_get_frames_to_idle = QtCore.Signal()
 	t_processing_and_filter_to_get_frames = QtCore.Signal()
 	t_processing_and_filter_to_save = QtCore.Signal()
 	t_save_to_get_frames = QtCore.Signal()
@@ -66,12 +82,18 @@ class GenericWorker(QtCore.QObject):
 	t_no_memory_to_save = QtCore.Signal()
 	t_no_memory_to_send_message = QtCore.Signal()
 	t_send_message_to_exit = QtCore.Signal()
+	t_idle_to_idle = QtCore.Signal()
+	t_idle_to_start_streams = QtCore.Signal()
+	t_idle_to_exit = QtCore.Signal()
 
 	# -------------------------
 
 	def __init__(self, mprx):
 		super(GenericWorker, self).__init__()
 
+		# it is None when IceStorm is not available, the events are not published then
+		self.lambscanevents_proxy = mprx.get("LambScanEventsPub")
+
 		self.mutex = QtCore.QMutex(QtCore.QMutex.Recursive)
 		self.Period = 30
 		self.timer = QtCore.QTimer(self)
@@ -90,6 +112,7 @@ class GenericWorker(QtCore.QObject):
 		self.no_memory_state = QtCore.QState(self.lambscan_state)
 		self.send_message_state = QtCore.QState(self.lambscan_state)
 		self.start_streams_state = QtCore.QState(self.lambscan_state)
+		self.idle_state = QtCore.QState(self.lambscan_state)
 
 		self.exit_state = QtCore.QFinalState(self.lambscan_state)
 
@@ -105,6 +128,7 @@ class GenericWorker(QtCore.QObject):
 		self.get_frames_state.addTransition(self.t_get_frames_to_no_camera, self.no_camera_state)
 		self.get_frames_state.addTransition(self.t_get_frames_to_get_frames, self.get_frames_state)
 		self.get_frames_state.addTransition(self.t_get_frames_to_exit, self.exit_state)
+		self.get_frames_state.addTransition(self.t_get_frames_to_idle, self.idle_state)
 		self.processing_and_filter_state.addTransition(self.t_processing_and_filter_to_get_frames,
 													   self.get_frames_state)
 		self.processing_and_filter_state.addTransition(self.t_processing_and_filter_to_save, self.save_state)
@@ -115,6 +139,9 @@ class GenericWorker(QtCore.QObject):
 		self.no_memory_state.addTransition(self.t_no_memory_to_save, self.save_state)
 		self.no_memory_state.addTransition(self.t_no_memory_to_send_message, self.send_message_state)
 		self.send_message_state.addTransition(self.t_send_message_to_exit, self.exit_state)
+		self.idle_state.addTransition(self.t_idle_to_idle, self.idle_state)
+		self.idle_state.addTransition(self.t_idle_to_start_streams, self.start_streams_state)
+		self.idle_state.addTransition(self.t_idle_to_exit, self.exit_state)
 
 		self.lambscan_state.entered.connect(self.sm_lambscan)
 		self.init_state.entered.connect(self.sm_init)
@@ -127,6 +154,7 @@ class GenericWorker(QtCore.QObject):
 		self.no_camera_state.entered.connect(self.sm_no_camera)
 		self.no_memory_state.entered.connect(self.sm_no_memory)
 		self.send_message_state.entered.connect(self.sm_send_message)
+		self.idle_state.entered.connect(self.sm_idle)
 
 		self.Application.setInitialState(self.init_state)
 		self.lambscan_state.setInitialState(self.start_streams_state)
@@ -189,6 +217,11 @@ class GenericWorker(QtCore.QObject):
 		print("Error: lack sm_exit in Specificworker")
 		sys.exit(-1)
 
+	@QtCore.Slot()
+	def sm_idle(self):
+		print("Error: lack sm_idle in Specificworker")
+		sys.exit(-1)
+
 	# -------------------------
 	@QtCore.Slot()
 	def killYourSelf(self):
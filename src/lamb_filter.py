@@ -1,5 +1,7 @@
+import os
 import cv2
 import numpy as np
+from depth_conditioning import DepthConditioner
 
 # zona de interes
 Yi = 146
@@ -7,12 +9,41 @@ Xi = 52
 Hi = 161
 Wi = 538
 
+# zona de interes en las coordenadas del stream de profundidad; es la misma que la de 640x480
+# salvo que se use un stream de menor resolucion (ver set_roi_transform)
+__roi__ = (Yi, Xi, Hi, Wi)
+
+# acondicionamiento de la profundidad de la zona de interes (pixeles no validos, huecos y suavizado temporal)
+depth_conditioning = True
+__conditioner__ = DepthConditioner()
+# fraccion minima de pixeles validos de un voxel para contarlo (si no, queda fuera del recuento)
+voxel_min_valid = 0.5
+# fraccion minima de pixeles validos de la zona de interes; por debajo la camara esta tapada
+min_valid_fraction = 0.3
+
 # porcentaje de reduccion del mapa de voxels
 voxel_scale_percent = 10
 
-# umbral de recuento de voxels
+# umbral de recuento de voxels (mientras el modelo de fondo no esta aprendido)
 voxel_threshold = 1150  # 1000 aprox.
 
+# modelo de fondo: tasa de aprendizaje, frames necesarios antes de usarlo,
+# desviaciones tipicas y margen minimo (mm) por encima del fondo para considerar un voxel ocupado.
+# El margen de cada voxel se fija al acabar el aprendizaje inicial a la distancia entre su fondo y
+# voxel_threshold, para que un voxel cuente a la misma altura sobre el suelo con la que se ajustaron
+# __bottom_threshold__ y __top_threshold__
+background_learning_rate = 0.02
+background_warmup = 50
+background_sigmas = 3
+background_margin = 100
+# aprendizaje lento de los voxels que siguen ocupados durante muchos frames seguidos
+# (cama nueva, camara desplazada...), aunque el frame no se clasifique como no_lamb
+background_stale_frames = 300
+background_slow_rate = 0.01
+# cada cuantas actualizaciones se guarda el modelo en disco
+background_save_every = 300
+__BACKGROUND_FILE__ = os.path.join(os.path.expanduser("~"), "LambSM", "etc", "background_model.npz")
+
 # establecemos los umbrales
 __top_threshold__ = 800
 __bottom_threshold__ = 430
@@ -24,31 +55,66 @@ def isThereALamb(color_image, depth_image):
 	Asks if the current image has a lamb in a right position
 	:param color_image: numpy array (640, 480, 3) shape RGB image.
 	:param depth_image: numpy array (640, 480, 1) shape Depth image.
-	:return: tuple(bool, string) the string shows more info about the image;
+	:return: tuple(bool, string, int) the string shows more info about the image;
 		it might be there's a part of a lamb in the image (still False).
+		The int is the number of voxels which satisfied the detection condition.
 	"""
-	depth_result = __isLamb__(depth_image)
-	print("\tNum Voxel:\t " + str(depth_result))
+	voxel_map = __voxel_map__(depth_image)
 	error_random = not bool(np.random.randint(150))
 	no_lamb_random = not bool(np.random.randint(80))
 
+	# sin suficientes pixeles validos la camara esta tapada o cegada; todos los voxels cuentan
+	if depth_conditioning and __conditioner__.valid_fraction < min_valid_fraction:
+		depth_result = voxel_map.size
+		print("\tNum Voxel:\t " + str(depth_result))
+		print("\tSomething is covering the camera (valid pixels: {:.0%})".format(__conditioner__.valid_fraction))
+		return error_random, "error", depth_result
+
+	depth_result = background.count_foreground(voxel_map)
+	print("\tNum Voxel:\t " + str(depth_result))
+
+	# el fondo se aprende de los frames vacios; del resto solo los voxels ocupados durante mucho tiempo
+	if depth_result < __under_bottom_threshold__:
+		background.update(voxel_map)
+	else:
+		background.observe(voxel_map)
+
 	# comprobamos el numero para determinar que se ha detectado
 	if __bottom_threshold__ <= depth_result < __top_threshold__:
 		print("\tThere's a lamb")
-		return True, "lamb"
+		return True, "lamb", depth_result
 	elif depth_result < __under_bottom_threshold__:
 		print("\tThere's no lamb")
-		return no_lamb_random, "no_lamb"
+		return no_lamb_random, "no_lamb", depth_result
 	elif depth_result < __bottom_threshold__:
 		print("\tThere's something (prob. a lamb in a wrong position)")
-		return error_random, "error"
+		return error_random, "error", depth_result
 	elif __top_threshold__ <= depth_result:
 		print("\tSomething is covering the camera")
-		return error_random, "error"
+		return error_random, "error", depth_result
 	else:
 		print("[!] Impossible print. Something is wrong in isThereALamb()")
 
-	return True, "to_check"
+	return True, "to_check", depth_result
+
+
+def isThereActivity(depth_images, transform=(1.0, 0.0, 1.0, 0.0)):
+	"""
+	Asks if there is something in the zona de interes, without classifying it. It is used by the
+	wake-up probes of the idle state, so it neither prints nor learns the background, and it uses its
+	own conditioner and zona de interes: the state of the detection is not changed.
+	:param depth_images: list of numpy arrays with consecutive depth images; the last one is checked.
+	:param transform: tuple(sx, ox, sy, oy) of the depth stream (see set_roi_transform).
+	:return: bool, True if the voxels over the background are not less than __under_bottom_threshold__,
+		or if the camera is covered.
+	"""
+	conditioner = DepthConditioner()
+	roi = __transform_roi__(*transform)
+	for depth_image in depth_images:
+		voxel_map = __voxel_map__(depth_image, roi, conditioner)
+	if depth_conditioning and conditioner.valid_fraction < min_valid_fraction:
+		return True
+	return background.count_foreground(voxel_map) >= __under_bottom_threshold__
 
 
 def __isLamb__(image):
@@ -61,19 +127,190 @@ def __isLamb__(image):
 	but it could be (640x480x3) of shape if we use a color image).
 	:return: int with the sumatory of the voxels which satisfied the detection condition.
 	"""
+	return background.count_foreground(__voxel_map__(image))
+
+
+def __voxel_map__(image, roi=None, conditioner=None):
+	"""
+	Recorta la imagen en la zona de interes y la reduce al mapa de voxels.
+	:param image: numpy array with (640x480x1) shape.
+	:param roi: tuple (y, x, h, w) with the zona de interes (the one of the stream by default).
+	:param conditioner: DepthConditioner to use (the one of the detection by default).
+	:return: numpy array with the voxel map; with depth_conditioning the voxels without enough
+		valid pixels are NaN.
+	"""
 	# recortamos en la zona de interes
-	image_crop = image[Yi:Yi + Hi, Xi:Xi + Wi]
+	y, x, h, w = __roi__ if roi is None else roi
+	conditioner = __conditioner__ if conditioner is None else conditioner
+	image_crop = image[y:y + h, x:x + w]
 
-	# reducimos al mapa de voxels
-	width = int(image_crop.shape[1] * voxel_scale_percent / 100)
-	height = int(image_crop.shape[0] * voxel_scale_percent / 100)
+	# reducimos al mapa de voxels; su tamaño no depende de la resolucion del stream
+	width = int(Wi * voxel_scale_percent / 100)
+	height = int(Hi * voxel_scale_percent / 100)
 	dim = (width, height)
-	resized_image = cv2.resize(image_crop, dim, interpolation=cv2.INTER_LANCZOS4)
-
-	#return (resized_image <= voxel_threshold).sum()
-	return np.count_nonzero(resized_image <= voxel_threshold)
-	# # contamos los voxels que superan el umbral
-	# for fila in resized_image:
-	# 	for voxel in fila:
-	# 		if voxel <= voxel_threshold:
-	# 			result += 1
+	if depth_conditioning and image_crop.ndim == 2:
+		# media de los pixeles validos de cada voxel; los voxels con pocos pixeles validos quedan a NaN
+		# (no cuentan en ningun umbral)
+		depth = conditioner.process(image_crop)
+		total = cv2.resize(depth, dim, interpolation=cv2.INTER_AREA)
+		weights = cv2.resize(conditioner.weights, dim, interpolation=cv2.INTER_AREA)
+		voxel_map = np.full(total.shape, np.nan, dtype=np.float32)
+		np.divide(total, weights, out=voxel_map, where=weights >= voxel_min_valid)
+		return voxel_map
+	return cv2.resize(image_crop, dim, interpolation=cv2.INTER_LANCZOS4)
+
+
+def set_roi_transform(sx=1.0, ox=0.0, sy=1.0, oy=0.0):
+	"""
+	It sets the region of interest (zona de interes) for a depth stream with another resolution. The pixel (x, y) of the
+	640x480 image is the pixel (x * sx + ox, y * sy + oy) of the stream (see RSCamera.get_roi_transform).
+	The default values are the ones of the 640x480 stream.
+	"""
+	global __roi__
+	__roi__ = __transform_roi__(sx, ox, sy, oy)
+
+
+def __transform_roi__(sx, ox, sy, oy):
+	x, y = int(round(Xi * sx + ox)), int(round(Yi * sy + oy))
+	return max(y, 0), max(x, 0), max(int(round(Hi * sy)), 1), max(int(round(Wi * sx)), 1)
+
+
+class BackgroundModel:
+	"""
+	Running per-voxel model of the empty scene (exponential mean and variance of the depth),
+	learnt from the frames classified as no_lamb (and, slowly, from the voxels which stay occupied
+	for a long time, see observe). A voxel is foreground (lamb) when it is closer
+	to the camera than the background by more than max(background_sigmas * std, margin).
+	The margin of each voxel is fixed at the end of the warmup to the height of the global
+	voxel_threshold over its background (at least background_margin), so the voxel counts keep the
+	meaning the thresholds of isThereALamb were tuned for while the background itself can move.
+	The threshold map is refreshed on every update, so counting costs the same as the global threshold.
+	Until background_warmup frames have been learnt the global voxel_threshold is used.
+	"""
+
+	def __init__(self, filename=__BACKGROUND_FILE__):
+		self.filename = filename
+		self.mean = None
+		self.var = None
+		self.streak = None
+		self.margin = None
+		self.frames = 0
+		self.updates = 0
+		self.threshold = voxel_threshold
+		self.load()
+
+	def count_foreground(self, voxel_map):
+		"""
+		:param voxel_map: numpy array with the voxel map of the current frame.
+		:return: int with the number of foreground voxels.
+		"""
+		if self.frames < background_warmup or self.mean.shape != voxel_map.shape:
+			return np.count_nonzero(voxel_map <= voxel_threshold)
+		return np.count_nonzero(voxel_map <= self.threshold)
+
+	def update(self, voxel_map):
+		"""
+		It learns the voxel map of an empty frame; the voxels which look occupied are not learnt
+		once the model is ready, so the lambs standing still are not absorbed by the background,
+		unless they stay occupied for background_stale_frames frames (see observe).
+		:param voxel_map: numpy array with the voxel map of a no_lamb frame.
+		"""
+		voxel_map = voxel_map.astype(np.float32)
+		invalid = np.isnan(voxel_map)
+		if invalid.all():
+			return
+		if self.mean is None or self.mean.shape != voxel_map.shape:
+			# the voxels not seen yet start as the farthest one (the floor)
+			self.mean = np.where(invalid, np.nanmax(voxel_map), voxel_map).astype(np.float32)
+			self.var = np.zeros_like(voxel_map)
+			self.streak = np.zeros(voxel_map.shape, dtype=np.int32)
+			self.margin = None
+			self.frames = 0
+		# the invalid voxels are not learnt
+		voxel_map = np.where(invalid, self.mean, voxel_map)
+		rate = np.full(voxel_map.shape, max(background_learning_rate, 1.0 / (self.frames + 1)), dtype=np.float32)
+		rate[invalid] = 0
+		var_rate = rate
+		if self.frames >= background_warmup:
+			foreground = voxel_map <= self.threshold
+			var_rate = np.where(foreground, 0, rate).astype(np.float32)
+			# the stale foreground voxels only move the mean (see observe)
+			rate = np.where(foreground & ~invalid, self.__stale_rate__(voxel_map), var_rate).astype(np.float32)
+		self.frames += 1
+		if self.frames == background_warmup:
+			self.margin = np.maximum(self.mean - voxel_threshold, background_margin).astype(np.float32)
+		self.__learn__(voxel_map, rate, var_rate)
+
+	def observe(self, voxel_map):
+		"""
+		It follows the frames which are not empty: only the voxels which have been in front of the
+		background for background_stale_frames frames in a row are learnt, at background_slow_rate. So a shift of the
+		scene (bedding, a knocked camera) is absorbed after a while instead of blocking the model.
+		Only the mean is moved: a jump in the variance would drop the voxels out of the foreground
+		halfway; once they are background again the no_lamb frames finish learning them.
+		:param voxel_map: numpy array with the voxel map of a frame not classified as no_lamb.
+		"""
+		if self.frames < background_warmup or self.mean.shape != voxel_map.shape:
+			return
+		voxel_map = voxel_map.astype(np.float32)
+		voxel_map = np.where(np.isnan(voxel_map), self.mean, voxel_map)
+		rate = self.__stale_rate__(voxel_map)
+		if rate.any():
+			self.__learn__(voxel_map, rate, 0)
+
+	def __stale_rate__(self, voxel_map):
+		# hysteresis: a voxel keeps its streak while it is closer than half the margin to the camera,
+		# so the noise around the threshold does not restart it while the mean is moving
+		self.streak += 1
+		self.streak[voxel_map >= self.mean - self.__margin__() / 2] = 0
+		return np.where(self.streak >= background_stale_frames, background_slow_rate, 0).astype(np.float32)
+
+	def __learn__(self, voxel_map, rate, var_rate):
+		"""
+		:param rate: numpy array with the learning rate of the mean of each voxel.
+		:param var_rate: numpy array (or 0) with the learning rate of the variance of each voxel.
+		"""
+		diff = voxel_map - self.mean
+		self.mean += rate * diff
+		self.var = (1 - var_rate) * (self.var + var_rate * diff * diff)
+		self.__refresh_threshold__()
+		self.updates += 1
+		if self.updates % background_save_every == 0:
+			self.save()
+
+	def __margin__(self):
+		return background_margin if self.margin is None else self.margin
+
+	def __refresh_threshold__(self):
+		self.threshold = self.mean - np.maximum(background_sigmas * np.sqrt(self.var), self.__margin__())
+
+	def load(self):
+		if self.filename and os.path.exists(self.filename):
+			try:
+				with np.load(self.filename) as data:
+					self.mean, self.var, self.frames = data["mean"], data["var"], int(data["frames"])
+					self.margin = data["margin"] if "margin" in data.files else None
+				self.streak = np.zeros(self.mean.shape, dtype=np.int32)
+				if self.margin is None and self.frames >= background_warmup:
+					self.margin = np.maximum(self.mean - voxel_threshold, background_margin).astype(np.float32)
+				self.__refresh_threshold__()
+			except Exception as e:
+				print("Problem loading the background model\n", e)
+				self.mean, self.var, self.margin, self.frames = None, None, None, 0
+
+	def save(self):
+		if self.filename is None or self.mean is None:
+			return
+		try:
+			os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+			tmp = self.filename + ".tmp.npz"
+			if self.margin is None:
+				np.savez(tmp, mean=self.mean, var=self.var, frames=self.frames)
+			else:
+				np.savez(tmp, mean=self.mean, var=self.var, frames=self.frames, margin=self.margin)
+			os.replace(tmp, self.filename)
+		except OSError as e:
+			print("Problem saving the background model\n", e)
+
+
+background = BackgroundModel()
@@ -0,0 +1,91 @@
+import os
+import io
+import time
+import cProfile
+import pstats
+from datetime import datetime
+
+__PATH__ = os.path.join(os.path.expanduser("~"), "LambSM", "profiles")
+
+# funciones (ademas de los estados sm_*) a las que se atribuye el tiempo en el resumen
+TRACKED = ("isThereALamb", "save_frames", "send_msg")
+
+
+class LoopProfiler:
+	"""
+	It profiles (cProfile) the state machine loop of the running worker for some seconds on demand.
+	request() is safe to be called from a signal handler: it only sets the pending time and the
+	profile is started and stopped by step(), which is called from the loop itself.
+	For each profile it writes <datetime>.prof (for pstats/snakeviz) and <datetime>.txt with the
+	time attributed to the sm_* states and the TRACKED functions.
+	"""
+
+	def __init__(self, path=__PATH__):
+		self.path = path
+		self.__pending__ = 0
+		self.__profile__ = None
+		self.__start__ = 0.0
+		self.__seconds__ = 0
+
+	def request(self, seconds):
+		"""
+		:param seconds: int with the seconds of the loop to profile.
+		"""
+		if self.__profile__ is None:
+			self.__pending__ = seconds
+
+	def step(self):
+		"""
+		It starts a requested profile, or stops the current one when its time has elapsed.
+		:return: string with the summary file once a profile is written, else None.
+		"""
+		if self.__profile__ is None and self.__pending__ > 0:
+			self.__seconds__, self.__pending__ = self.__pending__, 0
+			print("\n\t[ PROFILER ] profiling the next " + str(self.__seconds__) + " seconds\n")
+			self.__profile__ = cProfile.Profile()
+			self.__start__ = time.time()
+			self.__profile__.enable()
+		elif self.__profile__ is not None and time.time() - self.__start__ >= self.__seconds__:
+			return self.stop()
+		return None
+
+	def stop(self):
+		"""
+		It stops the current profile (if any) and writes it to disk.
+		:return: string with the summary file, else None.
+		"""
+		if self.__profile__ is None:
+			return None
+		self.__profile__.disable()
+		wall = time.time() - self.__start__
+		profile, self.__profile__ = self.__profile__, None
+		os.makedirs(self.path, exist_ok=True)
+		filename = os.path.join(self.path, datetime.fromtimestamp(self.__start__).strftime("%Y-%m-%d_%H-%M-%S"))
+		profile.dump_stats(filename + ".prof")
+		with open(filename + ".txt", "w") as f:
+			f.write(self.summary(profile, wall))
+		print("\n\t[ PROFILER ] profile written to " + filename + ".txt\n")
+		return filename + ".txt"
+
+	@staticmethod
+	def summary(profile, wall):
+		"""
+		:param profile: cProfile.Profile already disabled.
+		:param wall: float with the seconds the profile was enabled.
+		:return: string with the calls and the cumulative time of the sm_* states and TRACKED functions,
+			followed by the 30 most expensive functions.
+		"""
+		stats = pstats.Stats(profile)
+		tracked = {}
+		for (file, line, name), (cc, calls, tottime, cumtime, callers) in stats.stats.items():
+			if name.startswith("sm_") or name in TRACKED:
+				current = tracked.get(name, (0, 0.0))
+				tracked[name] = (current[0] + calls, current[1] + cumtime)
+		text = "Profiled {:.2f} s of the state machine loop\n\n".format(wall)
+		text += "{:<28}{:>10}{:>14}{:>10}\n".format("function", "calls", "cumtime (s)", "% wall")
+		for name, (calls, cumtime) in sorted(tracked.items(), key=lambda item: -item[1][1]):
+			text += "{:<28}{:>10}{:>14.4f}{:>10.2f}\n".format(name, calls, cumtime, 100 * cumtime / wall if wall else 0)
+		stream = io.StringIO()
+		stats.stream = stream
+		stats.sort_stats("cumulative").print_stats(30)
+		return text + "\n" + stream.getvalue()
@@ -1,24 +1,62 @@
+import time
 import pyrealsense2 as rs
 import numpy as np
 
 __HEIGHT__ = 480
 __WIDTH__ = 640
 
+# perfiles de streaming: (ancho, alto, fps) de cada stream, None si no se activa.
+#   "full": color y profundidad a 640x480, como siempre.
+#   "low":  solo profundidad a baja resolucion para la deteccion; para guardar se pasa a 640x480
+#           mientras siga habiendo frames que guardar (hold_full_frames).
+PROFILES = {
+	"full": {"depth": (__WIDTH__, __HEIGHT__, 30), "color": (__WIDTH__, __HEIGHT__, 30)},
+	"low": {"depth": (480, 270, 6), "color": None},
+}
+# segundos de frames descartados tras arrancar el pipeline, mientras se ajusta la exposicion
+__SETTLE_SECONDS__ = 1.0
+# segundos que el perfil low sigue a 640x480 despues del ultimo frame guardado
+__FULL_HOLD_SECONDS__ = 10
+
 
 class RSCamera:
 	"""
 	It configures and manages the camera device (RealSense D415, D400 series) and its library (PyRealSense2).
 	"""
 
-	def __init__(self):
+	def __init__(self, profile="full"):
+		"""
+		:param profile: string with the streaming profile (a key of PROFILES).
+		"""
+		if profile not in PROFILES:
+			raise ValueError("Unknown streaming profile: " + str(profile))
+		self.profile = profile
 		# Configure depth and color streams
 		self.__pipeline__ = rs.pipeline()
-		self.__config__ = rs.config()
-		self.__config__.enable_stream(rs.stream.depth, __WIDTH__, __HEIGHT__, rs.format.z16, 30)
-		self.__config__.enable_stream(rs.stream.color, __WIDTH__, __HEIGHT__, rs.format.bgr8, 30)
+		self.__config__ = self.__make_config__(PROFILES[profile])
+		self.__full_config__ = self.__make_config__(PROFILES["full"])
+		self.__pipeline_profile__ = None
+		# profile of the running pipeline (None if it is stopped), "full" during a hold of the "low" profile
+		self.__streaming__ = None
+		self.__full_until__ = 0.0
+		self.__roi_transform__ = None
+		self.stats = {"frames": 0, "wait_seconds": 0.0, "detections": 0, "detection_seconds": 0.0,
+					  "received_frames": 0, "received_bytes": 0, "streaming_seconds": 0.0,
+					  "full_switches": 0, "full_switch_seconds": 0.0}
+		# frames numbers of each stream since the pipeline was started: {"start": ts, "streams": {...}}
+		self.__session__ = None
 
 	# self.__config__.enable_stream(rs.stream.infrared)
 
+	@staticmethod
+	def __make_config__(profile):
+		config = rs.config()
+		if profile["depth"] is not None:
+			config.enable_stream(rs.stream.depth, profile["depth"][0], profile["depth"][1], rs.format.z16, profile["depth"][2])
+		if profile["color"] is not None:
+			config.enable_stream(rs.stream.color, profile["color"][0], profile["color"][1], rs.format.bgr8, profile["color"][2])
+		return config
+
 	def __del__(self):
 		try:
 			self.stop()
@@ -29,38 +67,191 @@ class RSCamera:
 
 	def start(self):
 		"""
-		It starts the pipeline of the camera device with the default configuration.
-		(Image of 640x480 shape, depth and color streams enabled)
+		It starts the pipeline of the camera device with the configuration of the profile.
+		(Image of 640x480 shape, depth and color streams enabled, for the "full" profile)
 		:return: bool: True if the starting was correct, else False.
 		"""
 		try:
 			# Start streaming
-			self.__pipeline__.start(self.__config__)
+			self.__run__(self.profile)
 			return True
 		except Exception as e:
 			print(e)
 			print(type(e))
 			return False
 
+	def __run__(self, profile):
+		"""
+		It (re)starts the pipeline with the configuration of the profile ("full", or the one of the camera).
+		It raises the exception of the SDK if the pipeline cannot be started.
+		"""
+		if self.__streaming__ is not None:
+			self.stop()
+		config = self.__config__ if profile == self.profile else self.__full_config__
+		self.__pipeline_profile__ = self.__pipeline__.start(config)
+		self.__streaming__ = profile
+		self.__begin_session__()
+
 	def get_frame(self):
 		"""
 		Get a new frame of the camera device
 		:return: tupe of numpy arrays with the image
-		(np.array(640x480x3) shape , np.array(640x480x1) shape) as the (color image, depth image)
+		(np.array(640x480x3) shape , np.array(640x480x1) shape) as the (color image, depth image).
+		The color image is None if the profile has no color stream, unless the full frames are held
+		(see hold_full_frames).
 		"""
+		if self.__streaming__ == "full" and self.profile != "full" and time.time() >= self.__full_until__:
+			# end of the hold of the full frames; it raises if the camera does not start again
+			self.__run__(self.profile)
+		ts = time.time()
 		# Wait for a coherent pair of frames: depth and color
 		frames = self.__pipeline__.wait_for_frames()
 		depth_frame = frames.get_depth_frame()
 		color_frame = frames.get_color_frame()
 		# infrared_frame = frames.get_infrared_frame()
-		if not depth_frame or not color_frame:
+		if not depth_frame or (PROFILES[self.__streaming__]["color"] is not None and not color_frame):
 			return None
 		depth_image = np.asanyarray(depth_frame.get_data())
-		color_image = np.asanyarray(color_frame.get_data())
+		color_image = np.asanyarray(color_frame.get_data()) if color_frame else None
 		# infrared_image = np.asanyarray(infrared_frame.get_data())
 
+		self.stats["frames"] += 1
+		self.stats["wait_seconds"] += time.time() - ts
+		self.__count_frames__(depth_frame, color_frame)
 		return color_image, depth_image
 
+	def hold_full_frames(self):
+		"""
+		It makes get_frame return frames of 640x480 with both streams, whatever the profile is, for
+		__FULL_HOLD_SECONDS__ from now on. With the "low" profile the pipeline is restarted with the
+		"full" configuration the first time, and it goes back to the low resolution one in get_frame when
+		the hold is over. So while the frames keep being saved the full pipeline keeps running, and the
+		saved frames are the ones which have been classified.
+		It raises the exception of the SDK if the camera cannot be started again.
+		"""
+		if PROFILES[self.profile] == PROFILES["full"]:
+			return
+		self.__full_until__ = time.time() + __FULL_HOLD_SECONDS__
+		if self.__streaming__ == "full":
+			return
+		ts = time.time()
+		try:
+			self.__run__("full")
+		except Exception:
+			# back to the profile of the camera before raising
+			self.__run__(self.profile)
+			raise
+		self.settle()
+		self.stats["full_switches"] += 1
+		self.stats["full_switch_seconds"] += time.time() - ts
+
+	def settle(self):
+		"""
+		It discards the frames of the first __SETTLE_SECONDS__ after starting the pipeline, while the
+		auto exposure settles.
+		"""
+		for _ in range(max(1, int(PROFILES[self.__streaming__]["depth"][2] * __SETTLE_SECONDS__))):
+			frames = self.__pipeline__.wait_for_frames()
+			self.__count_frames__(frames.get_depth_frame(), frames.get_color_frame())
+
+	def add_detection_time(self, seconds):
+		"""
+		It adds the time spent detecting (isThereALamb) on a frame of this camera to its stats.
+		"""
+		self.stats["detections"] += 1
+		self.stats["detection_seconds"] += seconds
+
+	def __begin_session__(self):
+		self.__session__ = {"start": time.time(), "streams": {}}
+
+	def __count_frames__(self, *frames):
+		"""
+		It keeps the first and last frame number of each stream, so the frames which the device has
+		sent (also the ones not read by the loop) are counted.
+		"""
+		if self.__session__ is None:
+			return
+		for frame in frames:
+			if frame:
+				number = frame.get_frame_number()
+				stream = str(frame.get_profile().stream_type())
+				counter = self.__session__["streams"].setdefault(stream, [number, number, frame.get_data_size()])
+				counter[1] = max(counter[1], number)
+
+	def __received__(self, session):
+		"""
+		:return: tuple(depth frames, bytes of all the streams, seconds) received in the session.
+		"""
+		frames, size = 0, 0
+		for stream, (first, last, nbytes) in session["streams"].items():
+			size += (last - first + 1) * nbytes
+			if stream == str(rs.stream.depth):
+				frames += last - first + 1
+		return frames, size, time.time() - session["start"]
+
+	def __end_session__(self):
+		if self.__session__ is not None:
+			frames, size, seconds = self.__received__(self.__session__)
+			self.stats["received_frames"] += frames
+			self.stats["received_bytes"] += size
+			self.stats["streaming_seconds"] += seconds
+			self.__session__ = None
+
+	def get_roi_transform(self):
+		"""
+		It computes how the pixels of the 640x480 depth image map to the depth stream of the profile,
+		using the intrinsics of both resolutions (they might not share the same field of view).
+		The camera must be started; during a hold of the full frames it is the one of the 640x480 stream.
+		:return: tuple(sx, ox, sy, oy), the pixel (x, y) of 640x480 is (x * sx + ox, y * sy + oy) in the stream.
+		"""
+		depth = PROFILES[self.__streaming__]["depth"]
+		if (depth[0], depth[1]) == (__WIDTH__, __HEIGHT__):
+			return 1.0, 0.0, 1.0, 0.0
+		if self.__roi_transform__ is None:
+			self.__roi_transform__ = self.__compute_roi_transform__(depth)
+		return self.__roi_transform__
+
+	def __compute_roi_transform__(self, depth):
+		low = self.get_profile_intrinsics(self.__pipeline_profile__.get_stream(rs.stream.depth))
+		full = None
+		for profile in self.__pipeline_profile__.get_device().first_depth_sensor().get_stream_profiles():
+			if profile.stream_type() == rs.stream.depth and profile.format() == rs.format.z16:
+				video = profile.as_video_stream_profile()
+				if (video.width(), video.height()) == (__WIDTH__, __HEIGHT__):
+					full = video.get_intrinsics()
+					break
+		if full is None:
+			# same field of view
+			return depth[0] / __WIDTH__, 0.0, depth[1] / __HEIGHT__, 0.0
+		sx = low.fx / full.fx
+		sy = low.fy / full.fy
+		return sx, low.ppx - full.ppx * sx, sy, low.ppy - full.ppy * sy
+
+	def get_stats(self):
+		"""
+		:return: dict with the measured cost of the profile so far: ms waiting for each frame, ms of
+			detection per frame, depth frames and MB per second actually received from the device
+			(from the frame numbers, so the frames not read by the loop are counted as well) and ms per
+			switch of the "low" profile to the full frames (hold_full_frames).
+		"""
+		frames, size, seconds = self.stats["received_frames"], self.stats["received_bytes"], self.stats["streaming_seconds"]
+		if self.__session__ is not None:
+			current = self.__received__(self.__session__)
+			frames, size, seconds = frames + current[0], size + current[1], seconds + current[2]
+		stats = {"profile": self.profile, "frames": self.stats["frames"], "full_switches": self.stats["full_switches"],
+				 "ms_wait_per_frame": 0.0, "ms_detection_per_frame": 0.0, "received_frames/s": 0.0,
+				 "received_MB/s": 0.0, "ms_per_full_switch": 0.0}
+		if self.stats["frames"] > 0:
+			stats["ms_wait_per_frame"] = round(1000 * self.stats["wait_seconds"] / self.stats["frames"], 3)
+		if self.stats["detections"] > 0:
+			stats["ms_detection_per_frame"] = round(1000 * self.stats["detection_seconds"] / self.stats["detections"], 3)
+		if seconds > 0:
+			stats["received_frames/s"] = round(frames / seconds, 2)
+			stats["received_MB/s"] = round(size / (1024 * 1024) / seconds, 2)
+		if self.stats["full_switches"] > 0:
+			stats["ms_per_full_switch"] = round(1000 * self.stats["full_switch_seconds"] / self.stats["full_switches"], 2)
+		return stats
+
 	# return color_image, depth_image, infrared_image
 
 	# Stop streaming
@@ -68,6 +259,8 @@ class RSCamera:
 		"""
 		It stops the pipeline of the camera device.
 		"""
+		self.__end_session__()
+		self.__streaming__ = None
 		self.__pipeline__.stop()
 
 	def get_profile_intrinsics(self, profile):
@@ -28,10 +28,16 @@ from genericworker import *
 # import librobocomp_innermodel
 from FileManager import save_frames, FileManager, get_saved_info
 from PySide2 import QtCore
-from rs_camera import RSCamera
-from lamb_filter import isThereALamb
+from rs_camera import RSCamera, PROFILES
+from lamb_filter import isThereALamb, isThereActivity, background, set_roi_transform
+from voxel_log import VoxelLog
 import signal
+import socket
+import time
 from send_message import send_msg
+from event_publisher import EventPublisher
+from loop_profiler import LoopProfiler
+from duty_cycle import DutyCycle
 
 
 class SpecificWorker(GenericWorker):
@@ -54,9 +60,25 @@ class SpecificWorker(GenericWorker):
 		self.info_timer.setInterval(self.Info_period)
 		self.info_timer.setSingleShot(True)
 
+		# duty cycle: outside the active windows the camera is stopped and the worker waits in the idle state
+		self.Idle_period = 1000 * 5  # 5 sec between two checks of the idle state
+		self.idle_timer = QtCore.QTimer(self)
+		self.idle_timer.setInterval(self.Idle_period)
+		self.idle_timer.setSingleShot(True)
+		self.idle_timer.timeout.connect(self.t_idle_to_idle)
+		self.duty_cycle = DutyCycle()
+
 		self.camera = None
+		# False while the camera is failing (no_camera) or a wake-up probe could not start it
+		self.camera_ok = True
+		self.stream_profile = "full"
 		self.lamb_path = ""
 		self.frame = (None, None)
+		self.voxel_log = VoxelLog()
+		self.voxels = 0
+		self.publisher = EventPublisher(self.lambscanevents_proxy, socket.gethostname())
+		self.profiler = LoopProfiler()
+		self.profile_seconds = 60
 
 		self.Application.start()
 
@@ -64,10 +86,33 @@ class SpecificWorker(GenericWorker):
 		print("\n\n\t[eCtrl + C]\n\n")
 		self.exit = True
 
+	def receive_profile_signal(self, signum, stack):
+		""" SIGUSR1: it profiles the next self.profile_seconds of the state machine loop """
+		self.profiler.request(self.profile_seconds)
+
 	def __del__(self):
 		print('SpecificWorker destructor')
 
 	def setParams(self, params):
+		if params.get("LambScan.Device"):
+			self.publisher.device = params["LambScan.Device"]
+		if params.get("LambScan.PublishPeriod"):
+			self.publisher.period = int(params["LambScan.PublishPeriod"])
+		if params.get("LambScan.StreamProfile"):
+			if params["LambScan.StreamProfile"] in PROFILES:
+				self.stream_profile = params["LambScan.StreamProfile"]
+			else:
+				print("[!] Unknown LambScan.StreamProfile \"" + params["LambScan.StreamProfile"] + "\" (" +
+					  ", ".join(PROFILES) + "). Using \"" + self.stream_profile + "\"")
+		if params.get("LambScan.ProfileSeconds"):
+			self.profile_seconds = int(params["LambScan.ProfileSeconds"])
+		try:
+			self.duty_cycle = DutyCycle(params.get("LambScan.ActiveWindows", ""),
+										int(params.get("LambScan.ProbePeriod") or 600),
+										int(params.get("LambScan.ActivityHold") or 900))
+		except ValueError as e:
+			print("[!] " + str(e) + ". The scanner will be always active")
+			self.duty_cycle = DutyCycle()
 		# try:
 		#	self.innermodel = InnerModel(params["InnerModelPath"])
 		# except:
@@ -85,6 +130,9 @@ class SpecificWorker(GenericWorker):
 		""" First state of the state machine, it triggers the LambScan main state """
 		print("Entered state init")
 		signal.signal(signal.SIGINT, self.receive_signal)
+		signal.signal(signal.SIGUSR1, self.receive_profile_signal)
+		# started once: the resumes of the duty cycle go through start_streams
+		self.info_timer.start()
 		self.t_init_to_lambscan.emit()
 
 	#
@@ -114,10 +162,12 @@ class SpecificWorker(GenericWorker):
 	def sm_start_streams(self):
 		print("Entered state start_streams")
 		try:
-			self.camera = RSCamera()
+			self.camera = RSCamera(self.stream_profile)
 			if self.camera.start():
+				set_roi_transform(*self.camera.get_roi_transform())
+				self.camera_ok = True
+				self.duty_cycle.resumed()
 				self.saver_timer.start()
-				self.info_timer.start()
 				self.t_start_streams_to_get_frames.emit()
 			else:
 				raise Exception("It couldn't start the streams")
@@ -131,17 +181,29 @@ class SpecificWorker(GenericWorker):
 	@QtCore.Slot()
 	def sm_get_frames(self):
 		print("Entered state get_frames")
+		self.profiler.step()
 		if self.exit:
 			print("\n\n\t[!] Ctrl + C received. Closing program...\n\n")
 			self.t_get_frames_to_exit.emit()
+			return
+		if not self.duty_cycle.is_active():
+			print("\tOut of the active windows. Stopping the camera...")
+			self.camera.__del__()
+			self.camera = None
+			self.duty_cycle.enter_idle()
+			print("\tDuty cycle: " + str(self.duty_cycle.get_stats()))
+			self.t_get_frames_to_idle.emit()
+			return
 		self.timer.start()
-		if self.info_timer.remainingTime() == 0:
-			send_msg(get_saved_info())
-			self.info_timer.start()
+		if not self.info_timer.isActive():
+			self.send_info()
+		self.publisher.publish_if_due(self.camera_ok, self.no_cam, self.no_memory)
 		try:
 			self.frame = self.camera.get_frame()
 			while self.timer.remainingTime() > 0:
 				self.frame = self.camera.get_frame()
+			# the "low" profile streams at 640x480 while the frames are being saved (see sm_save)
+			set_roi_transform(*self.camera.get_roi_transform())
 			self.t_get_frames_to_processing_and_filter.emit()
 		except Exception as e:
 			print("An error occur when taking a new frame,:\n " + str(e))
@@ -154,9 +216,12 @@ class SpecificWorker(GenericWorker):
 	@QtCore.Slot()
 	def sm_no_camera(self):
 		print("Entered state no_camera")
-		self.camera.__del__()
+		if self.camera is not None:
+			self.camera.__del__()
 		self.camera = None
 		self.no_cam += 1
+		self.camera_ok = False
+		self.publisher.publish_if_due(self.camera_ok, self.no_cam, self.no_memory)
 		if self.no_cam >= 12:
 			self.t_no_camera_to_send_message.emit()
 		else:
@@ -181,10 +246,22 @@ class SpecificWorker(GenericWorker):
 	def sm_processing_and_filter(self):
 		print("Entered state processing_and_filter")
 		self.no_cam = 0
-		isLamb, self.lamb_path = isThereALamb(*self.frame)
-		if isLamb or self.saver_timer.remainingTime() == 0:
+		ts = time.time()
+		isLamb, self.lamb_path, self.voxels = isThereALamb(*self.frame)
+		self.camera.add_detection_time(time.time() - ts)
+		if self.lamb_path != "no_lamb":
+			# something in the race: a wake-up of the duty cycle keeps capturing
+			self.duty_cycle.activity()
+		save = isLamb or self.saver_timer.remainingTime() == 0
+		try:
+			# sm_save marks the record as saved once the frame is on disk
+			self.voxel_log.append(self.voxels, self.lamb_path, False)
+		except (OSError, ValueError) as e:
+			print("Problem writing the voxel log\n", e)
+		if save:
 			self.t_processing_and_filter_to_save.emit()
 		else:
+			self.publisher.add_detection(self.voxels, self.lamb_path, False)
 			self.t_processing_and_filter_to_get_frames.emit()
 
 	#
@@ -194,10 +271,26 @@ class SpecificWorker(GenericWorker):
 	def sm_save(self):
 		print("Entered state save")
 		try:
-			save_frames(*self.frame, id_crotal=self.lamb_path)
+			# with the "low" profile the camera streams at 640x480 while the frames keep being saved, so the
+			# saved frames are the classified ones. A low resolution frame is not saved: the next frame is
+			# a full one, which is classified and saved if it has to.
+			self.camera.hold_full_frames()
+		except Exception as e:
+			# the camera is not streaming; get_frames goes to no_camera
+			print("An error occur when switching to the full frames,:\n " + str(e))
+			self.frame = (None, None)
+		if self.frame[0] is None:
+			self.publisher.add_detection(self.voxels, self.lamb_path, False)
+			self.t_save_to_get_frames.emit()
+			return
+		try:
+			record = save_frames(*self.frame, id_crotal=self.lamb_path)
+			self.voxel_log.mark_saved()
+			self.publisher.add_detection(self.voxels, self.lamb_path, True, record["depth"] if record else "")
 			self.saver_timer.start()
 			self.t_save_to_get_frames.emit()
-		except FileManager as e:
+		except (FileManager, OSError) as e:
+			# OSError: the folders could not be created (e.g. the disk is full)
 			print(("Problem saving the file\n", e))
 			self.t_save_to_no_memory.emit()
 
@@ -212,14 +305,80 @@ class SpecificWorker(GenericWorker):
 			send_msg("[ ! ] Error en la memoria del dispositivo. " + str(self.no_memory) + " intentos de escritura agotados.")
 		else:
 			send_msg("[ ? ] Estado SEND_MESSAGE incoherente. Se ha accedido a este estado sin que haya un error.")
+		self.publisher.publish(self.camera_ok, self.no_cam, self.no_memory)
 		self.t_send_message_to_exit.emit()
 
+	#
+	# sm_idle
+	#
+	@QtCore.Slot()
+	def sm_idle(self):
+		""" The camera is stopped; it waits for an active window or for activity seen by a wake-up probe. """
+		if self.exit:
+			print("\n\n\t[!] Ctrl + C received. Closing program...\n\n")
+			self.t_idle_to_exit.emit()
+			return
+		self.profiler.step()
+		if not self.info_timer.isActive():
+			self.send_info()
+		self.publisher.publish_if_due(self.camera_ok, self.no_cam, self.no_memory, idle=True)
+		if not self.duty_cycle.is_active() and self.duty_cycle.probe_due():
+			self.duty_cycle.probed(self.probe())
+		if self.duty_cycle.is_active():
+			print("Leaving state idle")
+			self.duty_cycle.leave_idle()
+			print("\tDuty cycle: " + str(self.duty_cycle.get_stats()))
+			self.t_idle_to_start_streams.emit()
+		else:
+			self.idle_timer.start()
+
+	def send_info(self):
+		""" Info message of every Info_period: saved frames, disk, camera and duty cycle stats. """
+		info = [get_saved_info()]
+		if self.camera is not None:
+			info.append(str(self.camera.get_stats()))
+		info.append(str(self.duty_cycle.get_stats()))
+		send_msg("\n".join(info))
+		self.info_timer.start()
+
+	def probe(self):
+		"""
+		Wake-up probe of the idle state: a few low resolution depth frames are taken to look for activity.
+		:return: bool, True if there is something in the race (or the camera failed, which start_streams handles).
+		"""
+		print("\tWake-up probe")
+		try:
+			camera = RSCamera("low")
+			self.camera_ok = camera.start()
+			if not self.camera_ok:
+				return True
+			try:
+				camera.settle()
+				depth_images = []
+				for _ in range(3):
+					frame = camera.get_frame()
+					if frame is not None:
+						depth_images.append(frame[1])
+				return not depth_images or isThereActivity(depth_images, camera.get_roi_transform())
+			finally:
+				camera.stop()
+		except Exception as e:
+			print("An error occur in the wake-up probe,:\n " + str(e))
+			self.camera_ok = False
+			return True
+
 	#
 	# sm_exit
 	#
 	@QtCore.Slot()
 	def sm_exit(self):
 		print("Entered state exit")
+		if self.camera is not None:
+			print(self.camera.get_stats())
+		print(self.duty_cycle.get_stats())
+		self.voxel_log.close()
+		self.profiler.stop()
+		background.save()
 		#self.camera.__del__()
 		self.t_lambscan_to_end.emit()
 
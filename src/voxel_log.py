@@ -0,0 +1,113 @@
+import os
+import time
+from datetime import date
+import numpy as np
+
+# registro de tamaño fijo de cada frame procesado
+RECORD = np.dtype([("timestamp", "<f8"), ("cam", "S8"), ("voxels", "<i4"), ("verdict", "u1"), ("saved", "?")])
+VERDICTS = ("lamb", "no_lamb", "error", "to_check")
+
+__PATH__ = os.path.join(os.path.expanduser("~"), "LambSM", "voxel_log")
+__MAGIC__ = b"LAMBVOX1"
+# cabecera: magic (8 bytes) + numero de registros escritos (uint64)
+__HEADER__ = np.dtype([("magic", "S8"), ("count", "<u8")])
+# registros reservados cada vez que crece el fichero (un dia a 1 frame por segundo)
+__CHUNK__ = 86400
+
+
+class VoxelLog:
+	"""
+	It appends a fixed-size record for every processed frame to a memory-mapped file of the day
+	(voxel_log/<date>.vox). The file grows in chunks and the header keeps the number of records,
+	so a record is only counted once it is completely written.
+	"""
+
+	def __init__(self, path=__PATH__):
+		self.__path__ = path
+		self.__day__ = None
+		self.__header__ = None
+		self.__records__ = None
+
+	def __del__(self):
+		try:
+			self.close()
+		except:
+			pass
+
+	def append(self, voxels, verdict, saved, cam="cam01", ts=None):
+		"""
+		:param voxels: int with the number of voxels returned by the lamb filter.
+		:param verdict: string with the category of the frame (one of VERDICTS).
+		:param saved: bool, True if the frame has been saved (see mark_saved).
+		:param cam: string with the camera where the frame has been taken.
+		:param ts: float with the timestamp of the frame (now by default).
+		"""
+		ts = time.time() if ts is None else ts
+		day = date.fromtimestamp(ts)
+		if day != self.__day__:
+			self.__open__(day)
+		count = int(self.__header__["count"][0])
+		if count >= len(self.__records__):
+			self.__open__(day, len(self.__records__) + __CHUNK__)
+		self.__records__[count] = (ts, cam, voxels, VERDICTS.index(verdict) if verdict in VERDICTS else 255, saved)
+		self.__header__["count"][0] = count + 1
+
+	def mark_saved(self, saved=True):
+		"""
+		It updates the saved field of the last record, once the save of its frame has finished.
+		"""
+		if self.__records__ is not None:
+			count = int(self.__header__["count"][0])
+			if count > 0:
+				self.__records__[count - 1]["saved"] = saved
+
+	def flush(self):
+		if self.__records__ is not None:
+			self.__records__.flush()
+			self.__header__.flush()
+
+	def close(self):
+		self.flush()
+		self.__day__ = None
+		self.__header__ = None
+		self.__records__ = None
+
+	def __open__(self, day, capacity=None):
+		self.close()
+		os.makedirs(self.__path__, exist_ok=True)
+		filename = os.path.join(self.__path__, "{}.vox".format(day))
+		if not os.path.exists(filename):
+			with open(filename, "wb") as f:
+				f.write(np.array([(__MAGIC__, 0)], dtype=__HEADER__).tobytes())
+		stored = (os.path.getsize(filename) - __HEADER__.itemsize) // RECORD.itemsize
+		capacity = max(stored, capacity or __CHUNK__)
+		if capacity > stored:
+			# the blocks are reserved now: a write to a hole of a sparse file with the disk full would be a SIGBUS
+			with open(filename, "r+b") as f:
+				os.posix_fallocate(f.fileno(), 0, __HEADER__.itemsize + capacity * RECORD.itemsize)
+		self.__header__ = np.memmap(filename, dtype=__HEADER__, mode="r+", shape=(1,))
+		if self.__header__["magic"][0] != __MAGIC__:
+			raise ValueError("Not a voxel log file: " + filename)
+		self.__records__ = np.memmap(filename, dtype=RECORD, mode="r+", offset=__HEADER__.itemsize, shape=(capacity,))
+		self.__day__ = day
+
+
+def read_day(day=None, path=__PATH__):
+	"""
+	It loads the records of a day without copying them (memory-mapped).
+	:param day: datetime.date or string "YYYY-MM-DD" (today by default).
+	:param path: string with the voxel_log folder.
+	:return: numpy structured array with the fields of RECORD; e.g. records["voxels"]
+		is the array of voxel counts. The verdicts are indexes of VERDICTS.
+	"""
+	day = date.today() if day is None else day
+	filename = os.path.join(path, "{}.vox".format(day))
+	if not os.path.exists(filename):
+		return np.zeros(0, dtype=RECORD)
+	header = np.fromfile(filename, dtype=__HEADER__, count=1)
+	if len(header) == 0 or header["magic"][0] != __MAGIC__:
+		raise ValueError("Not a voxel log file: " + filename)
+	count = int(header["count"][0])
+	if count == 0:
+		return np.zeros(0, dtype=RECORD)
+	return np.memmap(filename, dtype=RECORD, mode="r", offset=__HEADER__.itemsize, shape=(count,))
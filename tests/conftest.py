@@ -0,0 +1,20 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+@pytest.fixture
+def lamb_filter(tmp_path, monkeypatch):
+	"""
+	A fresh lamb_filter module, imported with a temporary HOME so the background model of the
+	device (~/LambSM/etc/background_model.npz) is neither loaded nor overwritten.
+	"""
+	pytest.importorskip("cv2")
+	monkeypatch.setenv("HOME", str(tmp_path))
+	monkeypatch.setitem(sys.modules, "lamb_filter", None)
+	del sys.modules["lamb_filter"]
+	return importlib.import_module("lamb_filter")
@@ -0,0 +1,73 @@
+import numpy as np
+
+import depth_conditioning
+from depth_conditioning import DepthConditioner
+
+
+def floor(shape=(16, 40), depth=1400):
+	return np.full(shape, depth, dtype=np.uint16)
+
+
+def test_valid_pixels_are_smoothed():
+	conditioner = DepthConditioner()
+	conditioner.process(floor(depth=1400))
+	result = conditioner.process(floor(depth=1420))
+	assert np.allclose(result, 1400 + depth_conditioning.temporal_alpha * 20)
+	assert conditioner.weights.all()
+
+
+def test_depth_jumps_are_not_smoothed():
+	conditioner = DepthConditioner()
+	conditioner.process(floor(depth=1400))
+	result = conditioner.process(floor(depth=900))
+	assert np.allclose(result, 900)
+
+
+def test_holes_are_filled_for_max_fill_age_frames_only():
+	conditioner = DepthConditioner()
+	conditioner.process(floor())
+	frame = floor()
+	frame[4:6, 10:20] = 0
+	for _ in range(depth_conditioning.max_fill_age):
+		result = conditioner.process(frame)
+		assert np.allclose(result[4:6, 10:20], 1400)
+		assert conditioner.weights[4:6, 10:20].all()
+	result = conditioner.process(frame)
+	assert (result[4:6, 10:20] == 0).all()
+	assert not conditioner.weights[4:6, 10:20].any()
+	assert conditioner.weights[:4].all()
+
+
+def test_rows_without_valid_pixels_nor_history_are_masked():
+	conditioner = DepthConditioner()
+	frame = floor()
+	frame[3] = 0
+	frame[7, :] = depth_conditioning.max_depth + 1
+	result = conditioner.process(frame)
+	assert not conditioner.weights[3].any()
+	assert not conditioner.weights[7].any()
+	assert (result[3] == 0).all() and (result[7] == 0).all()
+	assert conditioner.weights[0].all()
+
+
+def test_covered_frame_is_not_replayed():
+	conditioner = DepthConditioner()
+	for _ in range(60):
+		conditioner.process(floor())
+	covered = np.zeros((16, 40), dtype=np.uint16)
+	for _ in range(depth_conditioning.max_fill_age + 1):
+		conditioner.process(covered)
+		assert conditioner.valid_fraction == 0
+	assert not conditioner.weights.any()
+
+
+def test_lamb_filter_reports_covered_camera(lamb_filter, monkeypatch):
+	monkeypatch.setattr(lamb_filter, "background", lamb_filter.BackgroundModel(None))
+	empty = np.full((480, 640), 1400, dtype=np.uint16)
+	for _ in range(60):
+		assert lamb_filter.isThereALamb(None, empty)[1] == "no_lamb"
+	frames = lamb_filter.background.frames
+	result = lamb_filter.isThereALamb(None, np.zeros((480, 640), dtype=np.uint16))
+	assert result[1] == "error"
+	assert result[2] >= lamb_filter.__top_threshold__
+	assert lamb_filter.background.frames == frames
@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import pytest
+
+from duty_cycle import DutyCycle, parse_windows
+
+
+def at(hour, minute=0):
+	return datetime(2020, 1, 1, hour, minute).timestamp()
+
+
+def test_parse_windows():
+	assert parse_windows("") == []
+	assert parse_windows("06:00-14:00, 16:30-20:00") == [(360, 840), (990, 1200)]
+
+
+@pytest.mark.parametrize("text", ["6-7", "25:00-26:00", "06:60-07:00", "06:00", "06:00-07:00-08:00", "a:b-c:d",
+								  "06:00-06:00"])
+def test_parse_windows_rejects_wrong_windows(text):
+	with pytest.raises(ValueError):
+		parse_windows(text)
+
+
+def test_always_active_without_windows():
+	assert DutyCycle().is_active(at(3))
+
+
+def test_window_across_midnight():
+	duty_cycle = DutyCycle("22:00-02:00")
+	assert duty_cycle.is_active(at(23))
+	assert duty_cycle.is_active(at(1, 59))
+	assert not duty_cycle.is_active(at(2))
+	assert not duty_cycle.is_active(at(21, 59))
+
+
+def test_probe_hold_expires():
+	duty_cycle = DutyCycle("06:00-07:00", probe_period=600, activity_hold=900)
+	duty_cycle.probed(False, at(12))
+	assert not duty_cycle.is_active(at(12, 1))
+	assert not duty_cycle.probe_due(at(12, 9))
+	assert duty_cycle.probe_due(at(12, 10))
+	duty_cycle.probed(True, at(12, 10))
+	assert duty_cycle.is_active(at(12, 24))
+	assert not duty_cycle.is_active(at(12, 25))
+
+
+def test_activity_extends_the_hold():
+	duty_cycle = DutyCycle("06:00-07:00", activity_hold=900)
+	duty_cycle.probed(True, at(12))
+	duty_cycle.activity(at(12, 14))
+	assert duty_cycle.is_active(at(12, 28))
+	assert not duty_cycle.is_active(at(12, 29))
+	# an older activity does not shorten it
+	duty_cycle.activity(at(12))
+	assert duty_cycle.is_active(at(12, 28))
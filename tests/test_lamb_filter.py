@@ -0,0 +1,68 @@
+import numpy as np
+
+
+def voxels(lamb_filter, depth=1400.0):
+	shape = (int(lamb_filter.Hi * lamb_filter.voxel_scale_percent / 100),
+			 int(lamb_filter.Wi * lamb_filter.voxel_scale_percent / 100))
+	return np.full(shape, depth, dtype=np.float32)
+
+
+def learn(lamb_filter, model, voxel_map, frames):
+	# as isThereALamb does: the empty frames are learnt and the rest only observed
+	for _ in range(frames):
+		if model.count_foreground(voxel_map) < lamb_filter.__under_bottom_threshold__:
+			model.update(voxel_map)
+		else:
+			model.observe(voxel_map)
+
+
+def test_global_threshold_until_warmup(lamb_filter):
+	model = lamb_filter.BackgroundModel(None)
+	floor = voxels(lamb_filter)
+	learn(lamb_filter, model, floor, lamb_filter.background_warmup - 1)
+	assert model.margin is None
+	assert model.count_foreground(voxels(lamb_filter, 1100)) == floor.size
+	assert model.count_foreground(voxels(lamb_filter, 1200)) == 0
+	learn(lamb_filter, model, floor, 1)
+	assert np.allclose(model.margin, 1400 - lamb_filter.voxel_threshold)
+
+
+def test_counts_keep_the_global_threshold_meaning(lamb_filter):
+	model = lamb_filter.BackgroundModel(None)
+	learn(lamb_filter, model, voxels(lamb_filter), 100)
+	# 150 mm over the floor did not count with voxel_threshold and it does not count now
+	assert model.count_foreground(voxels(lamb_filter, 1250)) == 0
+	assert model.count_foreground(voxels(lamb_filter, 1100)) == voxels(lamb_filter).size
+
+
+def test_one_update_per_frame(lamb_filter):
+	model = lamb_filter.BackgroundModel(None)
+	floor = voxels(lamb_filter)
+	learn(lamb_filter, model, floor, 100)
+	updates = model.updates
+	model.update(floor)
+	assert model.updates == updates + 1
+
+
+def test_persistence(lamb_filter, tmp_path):
+	filename = str(tmp_path / "background_model.npz")
+	model = lamb_filter.BackgroundModel(filename)
+	learn(lamb_filter, model, voxels(lamb_filter), 100)
+	model.save()
+	loaded = lamb_filter.BackgroundModel(filename)
+	assert loaded.frames == model.frames
+	assert np.allclose(loaded.mean, model.mean)
+	assert np.allclose(loaded.margin, model.margin)
+	assert np.allclose(loaded.threshold, model.threshold)
+
+
+def test_scene_shift_is_relearnt(lamb_filter):
+	model = lamb_filter.BackgroundModel(None)
+	learn(lamb_filter, model, voxels(lamb_filter), 100)
+	shifted = voxels(lamb_filter, 1000)
+	learn(lamb_filter, model, shifted, lamb_filter.background_stale_frames - 1)
+	assert model.count_foreground(shifted) == shifted.size
+	learn(lamb_filter, model, shifted, 300)
+	assert model.count_foreground(shifted) < lamb_filter.__under_bottom_threshold__
+	# and a lamb over the new background is still detected
+	assert model.count_foreground(voxels(lamb_filter, 700)) == shifted.size